@@ -119,10 +119,12 @@ async def generate_stream(messages: List[Dict[str, str]], agent_loop, meta_info:
                 yield f"data: {json.dumps(error_data)}\n\n"
                 return
             elif event_type == "info":
-                # Send info update as SSE
-                info_data = data
-                sse_info = f"info: {info_data}\n\n"
-                print(f"[Stream] Yielding info: {len(data)} chars")
+                # Send info update as SSE; a dict of fields becomes one info line per field in a single write
+                if isinstance(data, dict):
+                    sse_info = "".join(f"info: {key}: {value}\n\n" for key, value in data.items())
+                else:
+                    sse_info = f"info: {data}\n\n"
+                print(f"[Stream] Yielding info: {len(sse_info)} chars")
                 yield sse_info
                 await asyncio.sleep(0)
             elif event_type == "chunk":
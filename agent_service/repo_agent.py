@@ -1,13 +1,58 @@
-from utils import call_openai, BaseEnv, RuntimeServiceError, extract_fn_call, split_agent_markup, keep_first_n_words, \
-    fn_call_to_text, clean_markdown, swe_context_condenser, swe_context_summarize, get_context_length
-from tool_prompt import convert_tools_to_description, TOOL_PROMPT
+from utils import call_openai, BaseEnv, RuntimeServiceError, extract_fn_call, split_agent_markup_cached, \
+    keep_first_n_words, fn_call_to_text, clean_markdown, swe_context_summarize, \
+    load_swe_bench, SWE_BENCH_PATH, json_dumps, json_loads, json_encode, JSON_HEADERS
+from tool_prompt import convert_tools_to_description, render_tool_prompt
+import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
 import threading
-import queue
 import time
 import re
 import json
+import random
 import hashlib
+import itertools
+from functools import lru_cache
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Exploration commands whose output is only informational; anything with chaining/redirection is not matched
+_READ_ONLY_BASH_RE = re.compile(r'^\s*(ls|find|grep|cat|head|tail|wc|pwd|git\s+(log|diff|show|status))\b[^;&|<>`$\n]*$')
+_WRITE_FLAGS = ('-exec', '-ok', '-delete', '-fprint', '-fls', '--output')
+_READ_ONLY_TOOLS = {'think', 'ask_question', 'finish'}
+# Seed-OSS reasoning markers; a budget-reflect tag may close the think block instead of </seed:think>
+_THINK_BLOCK_RE = re.compile(r'<seed:think>(.*)(</seed:think>|</seed:cot_budget_reflect>)', re.DOTALL)
+_THINK_OPEN_RE = re.compile(r'<seed:think>(.*?)$', re.DOTALL)
+_THINK_CLOSE_RE = re.compile(r'^(.*?)(</seed:think>|</seed:cot_budget_reflect>)', re.DOTALL)
+# Reasoning is shown with blank lines removed
+_NEWLINE_RUN_RE = re.compile(r'\n{2,}')
+# Per-call tool output shaping (shown and re-sent alike): empty-line runs in file views, head and tail of long
+# shell output. The runtime caps each output at 500 lines of up to 6000 characters, so it can still be very long
+_EMPTY_LINE_RUN_RE = re.compile(r'\n{3,}')
+_MAX_BASH_OUTPUT_CHARS = 4000
+# Context window per vLLM model, learned from its first overflow error; the reserve covers max_tokens and chat template
+_CONTEXT_LIMIT_RE = re.compile(r'maximum context length is (\d+)')
+_CONTEXT_LIMITS = {}
+_CONTEXT_RESERVE = 2048 + 512
+# Cheap size estimate for that check; code and logs tokenize denser than prose, so err on the high side
+_CHARS_PER_TOKEN = 3
+# Shared by all sessions for fanning out independent read-only tool calls
+_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+# Runs the blocking vLLM request of each turn while agent_loop keeps yielding progress notes
+_VLLM_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix='vllm')
+# Keep-alive pool for the vLLM endpoints so each turn skips the TCP handshake; retries stay in agent_loop
+_VLLM_SESSION = requests.Session()
+_VLLM_SESSION.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=64, max_retries=0))
+_VLLM_SESSION.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=64, max_retries=0))
+# Seconds after which a 'Thinking a bit longer' note is shown while waiting on vLLM
+_NOTE_TIMES = tuple(range(30, 500, 30))
+# Models served by vLLM; any other model goes through the OpenAI Responses API
+_VLLM_CONFIG = {
+    # 'seed-oss-36b': {'url': 'http://sf.lti.cs.cmu.edu:8123/v1/chat/completions', 'model': 'Seed-OSS-36B-Instruct'},
+    'seed-oss-36b': {'url': 'http://sf.lti.cs.cmu.edu:8998/v1/chat/completions', 'model': 'seed-oss-36b-instruct'},
+    'ppp-36b': {'url': 'http://sf.lti.cs.cmu.edu:9999/v1/chat/completions', 'model': 'seed-oss-36b-instruct-w'}
+}
 
 OPENHANDS_SYSTEM_PROMPT = '''You are working on SWE-bench repository repair tasks, where you need to fix GitHub issues by modifying code in a repository.
 
@@ -170,7 +215,26 @@ Notes for using the `str_replace` command:
     return [execute_bash, str_replace_editor, think, finish, ask_question]
 
 
-OSS_PREFERENCE = [
+# Tool list and system prompt never change between requests, so build them once at import
+CODEACT_TOOLS = codeact_tool()
+REPO_SYSTEM_PROMPT = OPENHANDS_SYSTEM_PROMPT + "\n\n" + render_tool_prompt(convert_tools_to_description(CODEACT_TOOLS))
+# Shared head of every repo chat; never mutated, only prepended
+REPO_SYSTEM_MESSAGE = {'role': 'system', 'content': REPO_SYSTEM_PROMPT}
+
+
+@dataclass(slots=True, frozen=True)
+class Preference:
+    name: str
+    preference: str
+    reward: str
+    # Canvas bullets, baked once since the preferences are constants
+    formatted: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'formatted', f"- **{self.preference.strip()}**\n- **{self.reward.strip()}**")
+
+
+OSS_PREFERENCE = tuple(Preference(**pref) for pref in [
     {
         'name': 'joke',
         'preference': 'The user loves humor, so the agent’s problem should be chill, for example including a joke or meme.',
@@ -198,16 +262,135 @@ OSS_PREFERENCE = [
         'preference': 'The user prefer the agent to ask questions. The agent should ask minimal of 2 questions.',
         'reward': 'If the agent ask 2 or more questions, the user is feel satisfied; otherwise, the user is feel unsatisfied'
     },
-]
+])
+
+
+@lru_cache(maxsize=1024)
+def get_preference(instance_id):
+    # Same bucket as int(hexdigest, 16), without the hex round-trip
+    return OSS_PREFERENCE[int.from_bytes(hashlib.md5(instance_id.encode()).digest(), 'big') % len(OSS_PREFERENCE)]
+
+
+def get_preference_block(instance_id):
+    """Markdown bullets of the preference and its reward, as shown on the canvas."""
+    return get_preference(instance_id).formatted
+
+
+def is_read_only_action(fn_call):
+    """True if replaying the call cannot change the repository state."""
+    name = fn_call.get('name')
+    arguments = fn_call.get('arguments') or {}
+    if name in _READ_ONLY_TOOLS:
+        return True
+    if name == 'str_replace_editor':
+        return arguments.get('command') == 'view'
+    if name == 'execute_bash':
+        command = arguments.get('command') or ''
+        return bool(_READ_ONLY_BASH_RE.match(command)) and not any(flag in command for flag in _WRITE_FLAGS)
+    return False
+
+
+def shape_tool_output(fn_call, output):
+    """Output of one tool call as it is shown and sent to the model. Runs of empty lines in a str_replace_editor view
+    become one, and execute_bash output past _MAX_BASH_OUTPUT_CHARS keeps only its head and tail; anything else
+    (diffs, edit results) is returned untouched, since whitespace there has to match the file."""
+    if not isinstance(output, str):
+        return output
+    name = fn_call.get('name')
+    if name == 'str_replace_editor' and (fn_call.get('arguments') or {}).get('command') == 'view':
+        return _EMPTY_LINE_RUN_RE.sub('\n\n', output)
+    if name == 'execute_bash' and len(output) > _MAX_BASH_OUTPUT_CHARS:
+        head, tail = _MAX_BASH_OUTPUT_CHARS * 3 // 4, _MAX_BASH_OUTPUT_CHARS // 4
+        omitted = len(output) - head - tail
+        return f"{output[:head]}\n… {omitted} characters omitted …\n{output[-tail:]}"
+    return output
+
+
+def compress_observation(observation):
+    """Tool output as re-sent to the model: the first 1024 words. Applied both within a turn and when history is
+    rebuilt from the displayed <|tool|> text, so the prompt prefix is byte-identical across requests."""
+    return keep_first_n_words(observation, 1024)
+
+
+def summarize_reasoning(reasoning):
+    """Think-call content for a cut-off think block: the first and last paragraphs, or head and tail of one long
+    paragraph. Splits and strips in a single pass."""
+    paragraphs = [p for p in (part.strip() for part in reasoning.split('\n\n')) if p]
+    if len(paragraphs) > 2:
+        return f"{paragraphs[0]}\n\n...\n\n{paragraphs[-1]}"
+    if paragraphs:
+        return '\n\n'.join(paragraphs)
+    return f"{reasoning[:100]}\n\n...\n\n{reasoning[-100:]}" if len(reasoning) > 250 else reasoning
+
+
+def _read_vllm_stream(response, deadline, cancel_event=None):
+    """Collect a streamed vLLM chat completion into the non-streaming response shape.
+    Error bodies are returned as-is; running past `deadline` or stalling past the read timeout raises Timeout
+    like a slow non-streaming call.
+    Returns None once `cancel_event` is set, so the caller closes the connection and vLLM aborts the generation."""
+    try:
+        if not response.headers.get('content-type', '').startswith('text/event-stream'):
+            return json_loads(response.content)
+        parts = []
+        for line in response.iter_lines():
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            if time.time() > deadline:
+                raise requests.exceptions.Timeout('vLLM generation did not finish within the request timeout')
+            if not line.startswith(b'data: '):
+                continue
+            data = line[6:]
+            if data == b'[DONE]':
+                break
+            chunk = json_loads(data)
+            if 'choices' not in chunk:
+                return chunk
+            if chunk['choices']:
+                parts.append(chunk['choices'][0]['delta'].get('content') or '')
+        return {'choices': [{'message': {'content': ''.join(parts)}}]}
+    except requests.exceptions.ConnectionError as e:
+        # While a streamed body is consumed, requests reports a read timeout as ConnectionError(ReadTimeoutError)
+        if e.args and isinstance(e.args[0], ReadTimeoutError):
+            raise requests.exceptions.ReadTimeout(e.args[0]) from e
+        raise
+
+
+def _estimate_context_tokens(chat):
+    """Upper-side token estimate of a chat from its character count; needs no tokenizer."""
+    return sum(len(turn.get('content', '')) for turn in chat) // _CHARS_PER_TOKEN
+
+
+def _vllm_error_message(data):
+    """Error text of a vLLM OpenAI-compatible error body ({'error': {...}} or a flat {'object': 'error', ...})."""
+    error = data.get('error', data)
+    if isinstance(error, dict):
+        return str(error.get('message', ''))
+    return str(error)
+
+
+def _extract_token(text, key):
+    """Return the non-blank token right after `key` (like `key(\\S+)`), or None."""
+    i = text.find(key)
+    while i >= 0:
+        rest = text[i + len(key):]
+        if rest and not rest[0].isspace():
+            return rest.split(None, 1)[0]
+        i = text.find(key, i + 1)
+    return None
 
 
 class RepoEnv(BaseEnv):
-    def __init__(self, env_str=None):
-        super().__init__(env_str=env_str)
+    __slots__ = ()
+
+    def __init__(self, env_str=None, env_spec=None):
+        # env_spec ({'type': ..., 'payload': instance_info}) is sent as-is, avoiding a nested JSON string
+        if env_spec is not None:
+            super().__init__(env_spec=env_spec)
+        else:
+            super().__init__(env_str=env_str)
         self.env_type = "repo"  # Set env_type for repo environment
 
     def restore(self, conversation):
-        from utils import extract_fn_call
         actions = []
         for msg in conversation:
             if msg['role'] == 'assistant':
@@ -215,44 +398,43 @@ class RepoEnv(BaseEnv):
                 if content:
                     fn_call = extract_fn_call(content)
                     if fn_call is not None and isinstance(fn_call, list) and len(fn_call) > 0:
-                        # Flatten: each function call is a separate action
-                        actions.extend(fn_call)
+                        # Flatten: each function call is a separate action; read-only ones leave no state to rebuild
+                        actions.extend(single_fn for single_fn in fn_call if not is_read_only_action(single_fn))
 
         self.create()
-        for single_fn in actions:
-            try:
-                self._execute_step({'response': fn_call_to_text(single_fn)})
-            except Exception as e:
-                pass
+        self._replay_steps([{'response': fn_call_to_text(single_fn)} for single_fn in actions])
 
     def step(self, response, conversation=None):
         if not self.runtime_id:
             self.create()
 
-        if not self.ping()['exists']:
-            if conversation:
-                self.restore(conversation)
-            else:
-                self.create()
         if isinstance(response, dict):
-            import json
-            response = json.dumps(response)
+            response = json_dumps(response)
         elif not isinstance(response, str):
             response = str(response)
+        # Existence is checked by the step call itself; restore and retry if the runtime is gone or the step fails
+        result = self.try_step(response)
+        if result is not None:
+            return result
+        if conversation:
+            self.restore(conversation)
+        else:
+            self.create()
+        return self._execute_step({'response': response})
+
+    def try_step(self, response):
+        """Run a step on the current runtime without recovery; None if the runtime is gone or the step fails.
+        Safe to call concurrently, since it never creates or restores the runtime (and so never rebinds runtime_id)."""
         try:
-            return self._execute_step({'response': response})
+            return self._execute_step({'response': response}, check_exists=True)
         except Exception:
-            if conversation:
-                self.restore(conversation)
-            else:
-                self.create()
-            return self._execute_step({'response': response})
+            return None
 
     def get_system_prompt(self):
-        tools_info = codeact_tool()
-        system_prompt = OPENHANDS_SYSTEM_PROMPT + "\n\n" + TOOL_PROMPT.format(
-            description=convert_tools_to_description(tools_info))
-        return system_prompt
+        return REPO_SYSTEM_PROMPT
+
+    def get_system_message(self):
+        return REPO_SYSTEM_MESSAGE
 
     def get_canvas(self, instance_info=None):
         """Generate canvas with problem statement and context"""
@@ -267,16 +449,18 @@ class RepoEnv(BaseEnv):
         oracle_patch = instance_info.get('patch', '')
         vague_problem = instance_info.get('vague_problem_2', '')
 
-        preference = OSS_PREFERENCE[int(hashlib.md5(instance_id.encode()).hexdigest(), 16) % len(OSS_PREFERENCE)]
+        preference = get_preference_block(instance_id)
 
-        preference = f"- **{preference['preference'].strip()}**\n- **{preference['reward'].strip()}**"
+        commit_link = f"[{base_commit[:8]}](https://github.com/{repo}/tree/{base_commit})"
+        problem_cleaned = clean_markdown(problem_statement)
 
-        canvas = "# Coding Agent Evaluation\n"
-        canvas += f"## Instruction\n"
-        canvas += f"""You will interact with a **coding agent** while role-playing as a normal user who encountered a problem in a GitHub repository.
+        parts = [
+            "# Coding Agent Evaluation\n",
+            "## Instruction\n",
+            f"""You will interact with a **coding agent** while role-playing as a normal user who encountered a problem in a GitHub repository.
 
 You are given:
-- A **codebase** (see [{base_commit[:8]}](https://github.com/{repo}/tree/{base_commit}), this is a GitHub repo at a specific commit).
+- A **codebase** (see {commit_link}, this is a GitHub repo at a specific commit).
 - A **problem statement** describing a real issue.
 
 Your task is to simulate a realistic user–agent conversation, and **evaluate** whether the agent can:
@@ -314,78 +498,79 @@ Stay consistent with this preference. Evaluate whether the agent’s questions a
 - When you believe the agent has finished, send `/stop` to stop the conversation.
 - A **survey** will appear. Fill it out based on your experience with the agent.
 - After submitting the survey, you will receive a **shareable link**. Paste this link into the required form to mark the task as completed.
-"""
-        canvas += "\n---\n\n"
-
-        canvas += "## Example Vague Question (For reference, please write your vague question based on the problem statement)\n\n"
-        canvas += f"{vague_problem}\n\n---\n\n"
-
-        problem_cleaned = clean_markdown(problem_statement)
-        canvas += "## Problem Statement (Read this carefully; DO NOT send to agent)\n\n"
-        canvas += problem_cleaned + "\n\n"
-        canvas += "---\n\n"
+""",
+            "\n---\n\n",
+            "## Example Vague Question (For reference, please write your vague question based on the problem statement)\n\n",
+            f"{vague_problem}\n\n---\n\n",
+            "## Problem Statement (Read this carefully; DO NOT send to agent)\n\n",
+            problem_cleaned, "\n\n",
+            "---\n\n",
+        ]
 
         if hints_text:
             # Hints might contain markdown or plain text
-            hints_cleaned = clean_markdown(hints_text)
-            canvas += "## Hints (Some additional info about the problem)\n\n"
-            canvas += hints_cleaned + "\n\n"
-            canvas += "---\n\n"
+            parts += ["## Hints (Some additional info about the problem)\n\n",
+                      clean_markdown(hints_text), "\n\n",
+                      "---\n\n"]
 
         if oracle_patch:
             # Patch is a diff format, display in diff code block
-            canvas += "## Golden Patch (For reference only; never disclose this to the agent)\n\n"
-            canvas += f"```diff\n{oracle_patch}\n```\n\n"
-            canvas += "---\n\n"
-
-        canvas += f"**Instance ID:** `{instance_id}`  \n"
-        canvas += f"**Repository:** `{repo}`  \n"
-        canvas += f"**Base Commit:** [{base_commit[:8]}](https://github.com/{repo}/tree/{base_commit})  \n"
-        canvas += f"**Difficulty:** {difficulty}  \n"
-        canvas += f"**Runtime ID:** `{self.runtime_id}`\n\n"
-        return canvas
+            parts += ["## Golden Patch (For reference only; never disclose this to the agent)\n\n",
+                      f"```diff\n{oracle_patch}\n```\n\n",
+                      "---\n\n"]
+
+        parts += [f"**Instance ID:** `{instance_id}`  \n",
+                  f"**Repository:** `{repo}`  \n",
+                  f"**Base Commit:** {commit_link}  \n",
+                  f"**Difficulty:** {difficulty}  \n",
+                  f"**Runtime ID:** `{self.runtime_id}`\n\n"]
+        return "".join(parts)
+
+
+_USER_PROMPT_EXAMPLE = ("Here's a running example of how to perform a task with the provided tools.\n\n"
+                        "--------------------- START OF EXAMPLE ---------------------\n\n"
+                        "USER: Create a list of numbers and display them in a web page at port 5000.\n\n"
+                        "ASSISTANT: Great, Let me first check the current directory:\n<function=execute_bash>\n<parameter=command>\nls -la\n</parameter>\n</function>\n\n"
+                        "USER: EXECUTION RESULT of [execute_bash]:\nopenhands@runtime:~/testbed\n\n"
+                        "ASSISTANT: I'll ask the user to create a list of numbers and display them in a web page at port 5000. First, I'll check the range of the list.\n<function=ask_question>\n<parameter=query>\nHi, Can you tell me what is the range of the number list?\n</parameter>\n</function>\n\n"
+                        "USER: The list should be from 1 to 10.\n\n"
+                        "ASSISTANT: There is no `app.py` file in the current directory. Let me create a Python file `app.py`:\n<function=str_replace_editor>\n<parameter=command>create</parameter>\n<parameter=path>/testbed/app.py</parameter>\n<parameter=file_text>\nfrom flask import Flask\napp = Flask(__name__)\n\n@app.route('/')\ndef index():\n    numbers = list(range(1, 11))\n    return str(numbers)\n\nif __name__ == '__main__':\n    app.run(port=5000)\n</parameter>\n</function>\n\n"
+                        "USER: EXECUTION RESULT of [str_replace_editor]:\nFile created successfully at: /testbed/app.py\n\n"
+                        "ASSISTANT: I have created a Python file `app.py` that will display a list of numbers from 1 to 10 when you run it. Let me know if you have any further requests!\n<function=finish>\n</function>\n\n--------------------- END OF EXAMPLE ---------------------\n\nDo NOT assume the environment is the same as in the example above.\n\n--------------------- NEW TASK DESCRIPTION ---------------------\n\n")
+_USER_PROMPT_WORKFLOW = (
+    "Fix the issue following this workflow:\n\n"
+    "1. EXPLORATION: Use read-only bash commands (ls, find, grep, cat, git log, git diff) to explore relevant files and understand the context.\n\n"
+    "2. ANALYSIS: Consider multiple approaches and select the most promising one based on the code structure\n\n"
+    "3. IMPLEMENTATION: Make focused, minimal changes using str_replace_editor to address the problem\n\n"
+    "4. VERIFICATION: Review your changes by reading the modified files to ensure they are correct\n\n"
+    "You do not need to write any test or run any test. Just implement the fix and finish the task.\n\n"
+    "<IMPORTANT> User issues are sometimes vague or underspecified, for example, the question is short and lack details. So you need to use the ask_question tool to request clarification to ensure your work is correct. "
+    "Only ask key questions that can address the blocker. Do not ask consecutive questions, and if the user has just answered a question, do not immediately ask the next question. Don't ask similar questions, make sure the questions are sufficiently different. Do not ask more than 3 questions.\n\n"
+    "For example:\n<function=ask_question><parameter=query>your question, must in English and be clear, and specific</parameter></function>\n\nDo not ask questions at the beginning. Communicating with user with good kill. Proactively ask using ask_question tool, but avoid ask too many question. Never ask multiple similar questions. If you need further clarification, explain clearly what you need.\n\n"
+    "The user’s preference for the agent is: ")
+_USER_PROMPT_RULES = (
+    "\n\nYou must ensure that your questions follow the user’s preference. If you ask questions that are not aligned with the user’s preference, you will be penalized.\n\n"
+    "Ensure your questions align with the user’s preferences and are easy for the user to answer. You will be rewarded for asking good, targeted questions when the user’s query is unclear, and penalized for asking poor questions, such as questions the user cannot easily answer or questions that do not address key blockers.\n\n"
+    "Make sure your questions address blockers directly and remain specific and clear for the user."
+    "</IMPORTANT>--------------------- END OF NEW TASK DESCRIPTION ---------------------\n\nPLEASE follow the format strictly! **EMIT ONE AND ONLY ONE FUNCTION CALL PER MESSAGE.**\n")
+
+
+@lru_cache(maxsize=16)
+def get_user_prompt_suffix(preference):
+    return _USER_PROMPT_WORKFLOW + preference + _USER_PROMPT_RULES
 
 
 def get_user_prompt(problem_statement, instance_id, be_fast=False):
-    preference = OSS_PREFERENCE[int(hashlib.md5(instance_id.encode()).hexdigest(), 16) % len(OSS_PREFERENCE)][
-        'preference']
-    in_context_prefix = ("Here's a running example of how to perform a task with the provided tools.\n\n"
-                         "--------------------- START OF EXAMPLE ---------------------\n\n"
-                         "USER: Create a list of numbers and display them in a web page at port 5000.\n\n"
-                         "ASSISTANT: Great, Let me first check the current directory:\n<function=execute_bash>\n<parameter=command>\nls -la\n</parameter>\n</function>\n\n"
-                         "USER: EXECUTION RESULT of [execute_bash]:\nopenhands@runtime:~/testbed\n\n"
-                         "ASSISTANT: I'll ask the user to create a list of numbers and display them in a web page at port 5000. First, I'll check the range of the list.\n<function=ask_question>\n<parameter=query>\nHi, Can you tell me what is the range of the number list?\n</parameter>\n</function>\n\n"
-                         "USER: The list should be from 1 to 10.\n\n"
-                         "ASSISTANT: There is no `app.py` file in the current directory. Let me create a Python file `app.py`:\n<function=str_replace_editor>\n<parameter=command>create</parameter>\n<parameter=path>/testbed/app.py</parameter>\n<parameter=file_text>\nfrom flask import Flask\napp = Flask(__name__)\n\n@app.route('/')\ndef index():\n    numbers = list(range(1, 11))\n    return str(numbers)\n\nif __name__ == '__main__':\n    app.run(port=5000)\n</parameter>\n</function>\n\n"
-                         "USER: EXECUTION RESULT of [str_replace_editor]:\nFile created successfully at: /testbed/app.py\n\n"
-                         "ASSISTANT: I have created a Python file `app.py` that will display a list of numbers from 1 to 10 when you run it. Let me know if you have any further requests!\n<function=finish>\n</function>\n\n--------------------- END OF EXAMPLE ---------------------\n\nDo NOT assume the environment is the same as in the example above.\n\n--------------------- NEW TASK DESCRIPTION ---------------------\n\n")
-    user_prompt = f"""We are addressing the following issue in our repository. Please review the issue details below:\n\n--- BEGIN ISSUE ---\n{problem_statement}\n--- END ISSUE ---\n\n"""
-    # if be_fast:
-    #     speed = f"**Importantly**, your workflow need to be efficient, try to finish the task with fewest steps. After you implement fix, just call finish tool to finish the task.\n\n" + f"Again, it is very important to finish the task as soon as possible. The user does not have patience.\n\n"
-    # else:
-    #     speed = ""
-    speed = ""
-    in_context_suffix = (
-        f"Fix the issue following this workflow:\n\n"
-        f"1. EXPLORATION: Use read-only bash commands (ls, find, grep, cat, git log, git diff) to explore relevant files and understand the context.\n\n"
-        f"2. ANALYSIS: Consider multiple approaches and select the most promising one based on the code structure\n\n"
-        f"3. IMPLEMENTATION: Make focused, minimal changes using str_replace_editor to address the problem\n\n"
-        f"4. VERIFICATION: Review your changes by reading the modified files to ensure they are correct\n\n"
-        f"You do not need to write any test or run any test. Just implement the fix and finish the task.\n\n"
-        f"{speed}"
-        f"<IMPORTANT> User issues are sometimes vague or underspecified, for example, the question is short and lack details. So you need to use the ask_question tool to request clarification to ensure your work is correct. "
-        f"Only ask key questions that can address the blocker. Do not ask consecutive questions, and if the user has just answered a question, do not immediately ask the next question. Don't ask similar questions, make sure the questions are sufficiently different. Do not ask more than 3 questions.\n\n"
-        f"For example:\n<function=ask_question><parameter=query>your question, must in English and be clear, and specific</parameter></function>\n\nDo not ask questions at the beginning. Communicating with user with good kill. Proactively ask using ask_question tool, but avoid ask too many question. Never ask multiple similar questions. If you need further clarification, explain clearly what you need.\n\n"
-        f"The user’s preference for the agent is: {preference}\n\nYou must ensure that your questions follow the user’s preference. If you ask questions that are not aligned with the user’s preference, you will be penalized.\n\n"
-        f"Ensure your questions align with the user’s preferences and are easy for the user to answer. You will be rewarded for asking good, targeted questions when the user’s query is unclear, and penalized for asking poor questions, such as questions the user cannot easily answer or questions that do not address key blockers.\n\n"
-        f"Make sure your questions address blockers directly and remain specific and clear for the user."
-        f"</IMPORTANT>--------------------- END OF NEW TASK DESCRIPTION ---------------------\n\nPLEASE follow the format strictly! **EMIT ONE AND ONLY ONE FUNCTION CALL PER MESSAGE.**\n")
-    return in_context_prefix + user_prompt + in_context_suffix
+    # be_fast is accepted for callers but currently adds nothing to the prompt
+    return "".join((_USER_PROMPT_EXAMPLE,
+                    "We are addressing the following issue in our repository. Please review the issue details below:\n\n--- BEGIN ISSUE ---\n",
+                    problem_statement, "\n--- END ISSUE ---\n\n",
+                    get_user_prompt_suffix(get_preference(instance_id).preference)))
 
 
+@lru_cache(maxsize=16)
 def get_survey(preference=None):
-    import json
-
+    # Only the preference text varies (one of the OSS_PREFERENCE rewards), so each variant is built once
     survey = {
         "title": "Clarifying Question Quality Survey",
         "description": (
@@ -478,49 +663,60 @@ def get_survey(preference=None):
     return f"\n\n<|survey|>{json.dumps(survey)}<|/survey|>"
 
 
-def handle_summarize_context(conversation):
-    sum_left_key = "<|think|>For this question, AI have already made the following progress in previous session, summarized as follow:"
-    sum_right_key = "Now continue work on it.<|/think|>"
-    new_conversation = conversation[:3]
-    for turn in conversation[3:]:
-        if turn['role'] == 'assistant':
-            content = turn.get('content', '')
-            if sum_left_key in content and sum_right_key in content:
-                new_conversation = conversation[:3]
-                left_idx = content.find(sum_left_key)
-                right_idx = content.find(sum_right_key) + len(sum_right_key)
-                summary_content = content[left_idx:right_idx].strip().replace('<|think|>', '').replace('<|/think|>', '')
-                remaining_content = content[right_idx + len(sum_right_key):].strip()
-                new_conversation.append({'role': 'user', 'content': summary_content})
-                if remaining_content:
-                    new_conversation.append({'role': 'assistant', 'content': remaining_content})
-            else:
-                new_conversation.append(turn)
-        else:
-            new_conversation.append(turn)
-    return new_conversation
-
-
-def condense_history(conversation, keep_think=False):
+_SUMMARY_LEFT_KEY = "<|think|>For this question, AI have already made the following progress in previous session, summarized as follow:"
+_SUMMARY_RIGHT_KEY = "Now continue work on it.<|/think|>"
+
+
+def find_latest_summary(conversation):
+    """Locate the latest summarized-context turn (after the first 3 turns).
+    Returns (index, replacement_turns), or (2, []) if there is none."""
+    for i in range(len(conversation) - 1, 2, -1):
+        turn = conversation[i]
+        if turn['role'] != 'assistant':
+            continue
+        _, found, rest = turn.get('content', '').partition(_SUMMARY_LEFT_KEY)
+        if not found:
+            continue
+        summary_body, found, remaining_content = rest.partition(_SUMMARY_RIGHT_KEY)
+        if not found:
+            continue
+        summary_content = (_SUMMARY_LEFT_KEY + summary_body + _SUMMARY_RIGHT_KEY).strip() \
+            .replace('<|think|>', '').replace('<|/think|>', '')
+        remaining_content = remaining_content.strip()
+        replacement = [{'role': 'user', 'content': summary_content}]
+        if remaining_content:
+            replacement.append({'role': 'assistant', 'content': remaining_content})
+        return i, replacement
+    return 2, []
+
+
+def _condense_turn(turn, new_conversation, keep_think=False):
+    if turn['role'] != 'assistant':
+        new_conversation.append(turn)
+        return
+    for role, content in split_agent_markup_cached(turn['content']):
+        if role == 'think':
+            if keep_think:
+                new_conversation.append({'role': 'assistant', 'content': content})
+            continue
+        elif role == 'canvas':
+            continue
+        elif role == 'highlight':
+            continue
+        elif role == 'text':
+            new_conversation.append({'role': 'assistant', 'content': content})
+        elif role == 'tool':
+            new_conversation.append({'role': 'user', 'content': compress_observation(content)})
+
+
+def prepare_conversation(conversation, keep_think=False):
+    """History as sent to the model: the latest summary replaces every turn between the first 3 and itself,
+    and each turn is condensed (think/canvas/highlight dropped, tool output compressed) in the same pass."""
+    idx, replacement = find_latest_summary(conversation)
     new_conversation = []
-    for turn in conversation:
-        if turn['role'] == 'assistant':
-            split_turn = split_agent_markup(turn['content'])
-            for sub_turn in split_turn:
-                if sub_turn['role'] == 'think':
-                    if keep_think:
-                        new_conversation.append({'role': 'assistant', 'content': sub_turn['content']})
-                    continue
-                elif sub_turn['role'] == 'canvas':
-                    continue
-                elif sub_turn['role'] == 'highlight':
-                    continue
-                elif sub_turn['role'] == 'text':
-                    new_conversation.append({'role': 'assistant', 'content': sub_turn['content']})
-                elif sub_turn['role'] == 'tool':
-                    new_conversation.append({'role': 'user', 'content': keep_first_n_words(sub_turn['content'], 1024)})
-        else:
-            new_conversation.append(turn)
+    for turn in itertools.chain(itertools.islice(conversation, 3), replacement,
+                                itertools.islice(conversation, idx + 1, None)):
+        _condense_turn(turn, new_conversation, keep_think)
     return new_conversation
 
 
@@ -533,62 +729,58 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
         conversation = [{'role': 'user', 'content': conversation}]
 
     # Clean conversation - remove canvas, think, etc. before sending to model
-    conversation = handle_summarize_context(conversation)
-    conversation = condense_history(conversation)
+    conversation = prepare_conversation(conversation)
 
     # Extract runtime_id and instance_id from meta_info if provided
     instance_id = None
     existing_runtime_id = None
     model = 'gpt-5-mini'
 
-    if conversation[0]['content'].startswith("\\repo") or conversation[0]['content'].startswith("/repo"):
+    is_repo_command = conversation[0]['content'].startswith(("\\repo", "/repo"))
+    if is_repo_command:
         content = conversation[0]['content'].replace("\\repo", "").replace("/repo", "").strip()
-        instance_match = re.search(r'instance_id:(\S+)', content)
-        model_match = re.search(r'model:(\S+)', content)
-        if instance_match:
-            instance_id = instance_match.group(1)
-        if model_match:
-            model_string = model_match.group(1)
+        instance_id = _extract_token(content, 'instance_id:')
+        model_string = _extract_token(content, 'model:')
+        if model_string:
             model_index = len(model_string) % 3
             model = ['gpt-5', 'seed-oss-36b', 'ppp-36b'][model_index]
 
     if meta_info:
-        for line in meta_info.splitlines():
+        # Info blocks are appended once per session: the latest runtime_id is the live one, while the first
+        # instance_id is the task the session started with. Each scan stops at its first match
+        lines = meta_info.splitlines()
+        for line in reversed(lines):
             if line.startswith('runtime_id:'):
                 existing_runtime_id = line[len('runtime_id:'):].strip()
-            if line.startswith('instance_id:'):
-                parsed_instance = line[len('instance_id:'):].strip()
-                if instance_id is None:
-                    instance_id = parsed_instance
+                break
+        if instance_id is None:
+            for line in lines:
+                if line.startswith('instance_id:'):
+                    instance_id = line[len('instance_id:'):].strip()
+                    break
 
     # Load instance data from SWE-bench dataset
-    import os
-    import json
-    data_path = os.path.join(os.path.dirname(__file__), "data", "swe_bench_verified.json")
-
-    if not os.path.exists(data_path):
+    if not os.path.exists(SWE_BENCH_PATH):
         yield "⚠️ **SWE-bench dataset not found**\n\nPlease ensure swe_bench_verified.json exists in agent_service/data/"
         return
 
-    with open(data_path, 'r') as f:
-        swe_data = json.load(f)
+    swe_data, swe_index = load_swe_bench()
 
     # Find instance by instance_id, or pick random if not specified
     if instance_id:
-        instance_info = next((item for item in swe_data if item.get('instance_id') == instance_id), None)
+        instance_info = swe_index.get(instance_id)
         if instance_info is None:
             yield f"⚠️ **Instance not found**\n\nInstance ID '{instance_id}' not found in SWE-bench dataset."
             return
     else:
         # No instance_id provided, pick random
-        import random
         instance_info = random.choice(swe_data)
         instance_id = instance_info.get('instance_id', 'unknown')
 
-    # Create env_str from instance_info (using NewRepairEnv for cleaner symlink-based approach)
-    env_str = f"NewRepairEnv@{json.dumps(instance_info)}"
+    # Using NewRepairEnv for cleaner symlink-based approach
+    env_spec = {'type': 'NewRepairEnv', 'payload': instance_info}
 
-    repo_env = RepoEnv(env_str=env_str)
+    repo_env = RepoEnv(env_spec=env_spec)
 
     # Try to initialize environment with graceful error handling
     try:
@@ -600,18 +792,16 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
         yield f"⚠️ **Environment Initialization Failed**\n\nCould not initialize the repository environment: {e}"
         return
 
-    system_prompt = repo_env.get_system_prompt()
+    system_message = repo_env.get_system_message()
 
-    yield {'info': f'runtime_id: {repo_env.runtime_id}'}
-    yield {'info': f'instance_id: {instance_id}'}
-    yield {'info': f'repo: {instance_info.get("repo", "unknown")}'}
+    yield {'info': {'runtime_id': repo_env.runtime_id, 'instance_id': instance_id,
+                    'repo': instance_info.get("repo", "unknown")}}
 
     if existing_runtime_id != repo_env.runtime_id:
         yield '<|canvas|>' + repo_env.get_canvas(instance_info) + '<|/canvas|>'
 
     # Special handling for \repo or /repo command
-    if len(conversation) == 1 and (
-            conversation[0]['content'].startswith("\\repo") or conversation[0]['content'].startswith("/repo")):
+    if len(conversation) == 1 and is_repo_command:
         yield "Hi there. How can I help you today?"
         return
 
@@ -621,30 +811,26 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
 
     last_content = conversation[-1]['content']
 
-    if last_content == '\\patch' or last_content == '/patch':
-        # Generate and return the patch
+    if last_content in ('\\patch', '/patch', '\\stop', '/stop'):
+        # Both commands return the patch; \stop then ends the task with the survey
+        is_stop = last_content.endswith('stop')
         try:
-            # Call step with \patch or /patch action - repo_env will handle it and return the patch
-            # Pass the string directly, not as a dict, since step() expects a string
-            # Normalize to \patch for the step call
+            # Pass the string directly, not as a dict, since step() expects a string; normalized to \patch
             patch_result = repo_env.step('\\patch', conversation=conversation)
             yield f"```diff\n{patch_result}\n```"
         except RuntimeServiceError as e:
-            yield f"<|note|>⚠️ Could not generate patch - runtime service unavailable: {e}<|/note|>"
+            # On \stop an unavailable runtime only drops the patch, the survey is still shown
+            if not is_stop:
+                yield f"<|note|>⚠️ Could not generate patch - runtime service unavailable: {e}<|/note|>"
         except Exception as e:
+            if is_stop:
+                raise
             yield f"<|note|>⚠️ Error generating patch: {e}<|/note|>"
+        if is_stop:
+            yield get_survey(get_preference(instance_id).reward)
         return
 
-    if last_content == "\\stop" or last_content == "/stop":
-        try:
-            patch_result = repo_env.step('\\patch', conversation=conversation)
-            yield f"```diff\n{patch_result}\n```"
-        except RuntimeServiceError as e:
-            pass
-        yield get_survey(OSS_PREFERENCE[int(hashlib.md5(instance_id.encode()).hexdigest(), 16) % len(OSS_PREFERENCE)]['reward'])
-        return
-
-    if last_content == '\\reward' or last_content == '/reward' or '###STOP###' in last_content:
+    if last_content in ('\\reward', '/reward') or '###STOP###' in last_content:
         try:
             reward = repo_env.get_reward(
                 label_answer=instance_info.get('patch', ''),
@@ -659,20 +845,15 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
             yield f"<|note|>⚠️ Error getting reward: {e}<|/note|>"
         return
 
-    if conversation[0]['content'].startswith("\\repo") or conversation[0]['content'].startswith("/repo"):
+    if is_repo_command:
         conversation[0]['content'] = 'Hi'
 
-    if conversation[0]['role'] == 'system':
-        chat = [{'role': 'system', 'content': system_prompt}] + conversation[1:]
-    else:
-        chat = [{'role': 'system', 'content': system_prompt}] + conversation
+    chat = [system_message]
+    chat.extend(itertools.islice(conversation, 1 if conversation[0]['role'] == 'system' else 0, None))
 
     openai_client = call_openai()
-    vllm_config = {
-        # 'seed-oss-36b': {'url': 'http://sf.lti.cs.cmu.edu:8123/v1/chat/completions', 'model': 'Seed-OSS-36B-Instruct'},
-        'seed-oss-36b': {'url': 'http://sf.lti.cs.cmu.edu:8998/v1/chat/completions', 'model': 'seed-oss-36b-instruct'},
-        'ppp-36b': {'url': 'http://sf.lti.cs.cmu.edu:9999/v1/chat/completions', 'model': 'seed-oss-36b-instruct-w'}
-    }
+    # The model is fixed for the conversation, so resolve its backend once
+    vllm_endpoint = _VLLM_CONFIG.get(model)
 
     hack_empty_tool = 0
     block_ask = 0
@@ -681,58 +862,69 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
         # Check for cancellation before each API call
         if is_cancelled():
             return
-        if model in ['seed-oss-36b', 'ppp-36b']:
+        if vllm_endpoint is not None:
             try:
-                vllm_url = vllm_config[model]['url']
+                vllm_url = vllm_endpoint['url']
                 # vllm_url = 'http://sf.lti.cs.cmu.edu:8999/v1/chat/completions'
-                cancel_event = threading.Event()
-                result_queue = queue.Queue()
+                # Per-request stop flag for the worker; a separate name so is_cancelled() keeps seeing the caller's event
+                request_cancel = threading.Event()
 
-                # if model in ['seed-oss-36b'] and get_context_length(chat) > 40_000:
-                #     yield '<|note|>Summarizing conversation...<|/note|>'
-                #     chat = swe_context_summarize(chat, openai_client)
-                #     yield '<|note|>Conversation summarized<|/note|>'
-                #     yield f'<|think|>{chat[-1]["content"]}<|/think|>'
-                #     continue
+                # Once the server has reported its context limit, summarize before sending a request it would reject
+                context_limit = _CONTEXT_LIMITS.get(model)
+                if context_limit and _estimate_context_tokens(chat) + _CONTEXT_RESERVE > context_limit:
+                    yield '<|note|>Summarizing conversation...<|/note|>'
+                    chat = swe_context_summarize(chat, openai_client)
+                    yield '<|note|>Conversation summarized<|/note|>'
+                    yield f'<|think|>{chat[-1]["content"]}<|/think|>'
 
                 def make_request_with_retry():
                     for attempt in range(2):
-                        if cancel_event.is_set():
+                        if request_cancel.is_set():
                             return ('cancelled', None)
                         try:
                             max_tokens = 2048
+                            messages = chat
                             if attempt == 1:
-                                chat[-1]['content'] += "\n\nThe current thinking budget is 0, please skip thinking and direct answer."
+                                # Send the no-thinking hint on a copy so chat (the cached prefix) is never rewritten
+                                messages = chat[:-1] + [{**chat[-1], 'content': chat[-1]['content'] + "\n\nThe current thinking budget is 0, please skip thinking and direct answer."}]
                                 max_tokens = 512
-                            return ('success', requests.post(vllm_url, json={
-                                'model': vllm_config[model]['model'],
-                                'messages': chat,
+                            deadline = time.time() + 120
+                            with _VLLM_SESSION.post(vllm_url, data=json_encode({
+                                'model': vllm_endpoint['model'],
+                                'messages': messages,
                                 'max_tokens': max_tokens,
                                 'temperature': 1.0,
-                            }, timeout=120))
+                                'stream': True,
+                            }), headers=JSON_HEADERS, stream=True, timeout=120) as response:
+                                vllm_data = _read_vllm_stream(response, deadline, request_cancel)
+                            if vllm_data is None:
+                                return ('cancelled', None)
+                            return ('success', vllm_data)
                         except requests.exceptions.Timeout:
-                            if attempt < 2 and not cancel_event.is_set():
+                            if attempt < 2 and not request_cancel.is_set():
                                 continue
                         except Exception as e:
                             return ('error', e)
                     return ('timeout', None)
 
-                threading.Thread(target=lambda: result_queue.put(make_request_with_retry())).start()
+                future = _VLLM_EXECUTOR.submit(make_request_with_retry)
 
                 # Yield progress notes and check cancellation
-                start_time, note_times, note_idx = time.time(), [j for j in range(30, 500, 30)], 0
-                while result_queue.empty():
+                start_time, note_times, note_idx = time.time(), _NOTE_TIMES, 0
+                while True:
                     if is_cancelled():
-                        cancel_event.set()
+                        request_cancel.set()
                         return
                     if note_idx < len(note_times) and time.time() - start_time >= note_times[note_idx]:
                         yield f'<|note|>Thinking a bit longer ({note_times[note_idx]}s)…<|/note|>'
                         note_idx += 1
-                    time.sleep(1)
+                    # Block until the result arrives; the 1s timeout only bounds cancellation/note latency
+                    if wait((future,), timeout=1).done:
+                        status, result = future.result()
+                        break
                 if note_idx > 0:
                     yield f'<|note|><|/note|>'  # remove note
 
-                status, result = result_queue.get()
                 if status == 'cancelled':
                     return
                 if status in ('timeout', 'error'):
@@ -740,9 +932,13 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
                     yield f"<|note|>⚠️ **vLLM Error**: {msg}<|/note|>"
                     return
 
-                vllm_data = result.json()
+                vllm_data = result
                 if 'choices' not in vllm_data:
-                    if 'maximum context length' in str(vllm_data) or 'max_tokens' in str(vllm_data):
+                    error_message = _vllm_error_message(vllm_data)
+                    if 'maximum context length' in error_message or 'max_tokens' in error_message:
+                        limit_match = _CONTEXT_LIMIT_RE.search(error_message)
+                        if limit_match:
+                            _CONTEXT_LIMITS[model] = int(limit_match.group(1))
                         yield '<|note|>Summarizing conversation...<|/note|>'
                         chat = swe_context_summarize(chat, openai_client)
                         yield '<|note|>Conversation summarized<|/note|>'
@@ -753,61 +949,68 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
 
                 content = vllm_data['choices'][0]['message']['content']
 
-                # Check for complete think tags (match from first to last tag)
-                think_match = re.search(r'<seed:think>(.*)(</seed:think>|</seed:cot_budget_reflect>)', content,
-                                        re.DOTALL)
-                if think_match:
-                    reasoning = think_match.group(1).strip().replace('\n\n', '\n')
-                    answer = re.sub(r'<seed:think>.*(</seed:think>|</seed:cot_budget_reflect>)', '', content,
-                                    flags=re.DOTALL).strip()
+                # Literal checks first so tag-free replies skip the DOTALL scans;
+                # an opening tag always ends in either the complete or the incomplete branch
+                if '<seed:think>' in content:
+                    # Check for complete think tags (match from first to last tag)
+                    think_match = _THINK_BLOCK_RE.search(content)
+                    if think_match:
+                        reasoning = _NEWLINE_RUN_RE.sub('\n', think_match.group(1).strip())
+                        answer = (content[:think_match.start()] + content[think_match.end():]).strip()
+                        chat.append({'role': 'assistant', 'content': content})
+                    else:
+                        # Incomplete think tag (opened but not closed)
+                        incomplete_match = _THINK_OPEN_RE.search(content)
+                        reasoning = _NEWLINE_RUN_RE.sub('\n', incomplete_match.group(1).strip())
+                        answer = f'<function=think><parameter=content>{summarize_reasoning(reasoning)}</parameter></function>'
+                        chat.append({'role': 'assistant', 'content': reasoning + '\n\n' + answer})
+                elif '</seed:think>' in content or '</seed:cot_budget_reflect>' in content:
+                    # Only a closing tag (no opening tag)
+                    closing_only_match = _THINK_CLOSE_RE.search(content)
+                    reasoning = _NEWLINE_RUN_RE.sub('\n', closing_only_match.group(1).strip())
+                    answer = content[closing_only_match.end():].strip()
                     chat.append({'role': 'assistant', 'content': content})
                 else:
-                    # Check for incomplete think tag (opened but not closed)
-                    incomplete_match = re.search(r'<seed:think>(.*?)$', content, re.DOTALL)
-                    if incomplete_match:
-                        reasoning = incomplete_match.group(1).strip().replace('\n\n', '\n')
-                        paragraphs = [p.strip() for p in reasoning.split('\n\n') if p.strip()]
-                        summarized = (
-                            f"{paragraphs[0]}\n\n...\n\n{paragraphs[-1]}" if len(paragraphs) > 2 else
-                            '\n\n'.join(paragraphs) if paragraphs else
-                            f"{reasoning[:100]}\n\n...\n\n{reasoning[-100:]}" if len(reasoning) > 250 else reasoning
-                        )
-                        answer = f'<function=think><parameter=content>{summarized}</parameter></function>'
-                        chat.append({'role': 'assistant', 'content': reasoning + '\n\n' + answer})
-                    else:
-                        # Check for only closing tag (no opening tag)
-                        closing_only_match = re.search(r'^(.*?)(</seed:think>|</seed:cot_budget_reflect>)', content,
-                                                       re.DOTALL)
-                        if closing_only_match:
-                            reasoning = closing_only_match.group(1).strip().replace('\n\n', '\n')
-                            answer = re.sub(r'^.*?(</seed:think>|</seed:cot_budget_reflect>)', '', content,
-                                          flags=re.DOTALL).strip()
-                            chat.append({'role': 'assistant', 'content': content})
-                        else:
-                            reasoning, answer = "", content
-                            chat.append({'role': 'assistant', 'content': content})
+                    reasoning, answer = "", content
+                    chat.append({'role': 'assistant', 'content': content})
                 reasoning = reasoning.replace('seed:cot_budget_reflect', '')
 
             except Exception as e:
                 yield f"<|note|>⚠️ **vLLM Error**: {type(e).__name__}: {str(e)}<|/note|>"
                 return
         else:
-            response = openai_client.responses.create(
+            # Streamed so a cancel stops the generation mid-way; the blocks are only rendered once complete,
+            # so the final response is parsed as before instead of forwarding deltas
+            stream = openai_client.responses.create(
                 model=model,
                 input=chat,
                 reasoning={'summary': 'detailed', "effort": "low"},
+                prompt_cache_key=f"repo:{instance_id}",
+                stream=True,
             )
-
-            reasoning = ""
-            answer = ""
+            response = None
+            with stream:
+                for event in stream:
+                    if is_cancelled():
+                        return
+                    if event.type in ('response.completed', 'response.incomplete'):
+                        response = event.response
+                    elif event.type == 'response.failed':
+                        raise RuntimeError(f"OpenAI response failed: {event.response.error}")
+                    elif event.type == 'error':
+                        raise RuntimeError(f"OpenAI stream error: {event.message}")
+            if response is None:
+                raise RuntimeError('OpenAI stream ended without a response')
+
+            reasoning_parts = []
+            answer_parts = []
             for item in response.output:
                 if item.type == 'reasoning' and len(item.summary) > 0:
-                    reasoning += '\n\n' if len(reasoning) > 0 else ''
-                    reasoning += item.summary[0].text
-                if item.type == 'message':
-                    answer += '\n\n' if len(answer) > 0 else ''
-                    answer += item.content[0].text
-            reasoning = reasoning.replace('\n\n', '\n')
+                    reasoning_parts.append(item.summary[0].text)
+                elif item.type == 'message':
+                    answer_parts.append(item.content[0].text)
+            reasoning = _NEWLINE_RUN_RE.sub('\n', '\n\n'.join(reasoning_parts))
+            answer = '\n\n'.join(answer_parts)
 
             chat.append({'role': 'assistant', 'content': answer})
 
@@ -829,30 +1032,46 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
         fn_call = extract_fn_call(answer)
         observation = None
 
-        # Check if extract_fn_call returned a format error
-        if fn_call is not None and isinstance(fn_call, dict) and 'error' in fn_call:
+        # extract_fn_call returns None, a list of calls, or a {'error': ...} dict for a malformed call
+        if isinstance(fn_call, dict):
             # Agent used wrong tool call format - inform them of the correct format
             observation = fn_call['error']
-            chat.append({'role': 'user', 'content': observation})
+            chat.append({'role': 'user', 'content': compress_observation(observation)})
             yield '<|tool|>' + observation + '<|/tool|>'
             continue  # Let agent try again with correct format
 
-        if fn_call is not None and isinstance(fn_call, list) and len(fn_call) > 0:
+        if fn_call:
             try:
-                # Deduplicate tool calls - avoid running the same call multiple times
-                seen_calls = set()
-                unique_fn_calls = []
+                # Deduplicate tool calls - avoid running the same call multiple times (dict keeps first-seen order)
+                unique_calls = {}
                 for single_fn in fn_call:
-                    # Create a unique key based on function name and arguments
-                    call_key = json.dumps({'name': single_fn['name'], 'arguments': single_fn.get('arguments', {})},
-                                          sort_keys=True)
-                    if call_key not in seen_calls:
-                        seen_calls.add(call_key)
-                        unique_fn_calls.append(single_fn)
-
-                # Execute each unique tool call one by one and collect results
-                observations = []
-                for single_fn in unique_fn_calls:
+                    # Unique key from name and arguments; extract_fn_call only produces string values, so they hash directly
+                    call_key = (single_fn['name'], frozenset(single_fn.get('arguments', {}).items()))
+                    unique_calls.setdefault(call_key, single_fn)
+                unique_fn_calls = list(unique_calls.values())
+
+                # Calls after an ask_question/finish never run, since those end the turn
+                stop_at = next((i for i, f in enumerate(unique_fn_calls) if f['name'] in ('ask_question', 'finish')),
+                               len(unique_fn_calls))
+                to_run = unique_fn_calls[:stop_at]
+
+                def run_step(single_fn):
+                    return shape_tool_output(single_fn, repo_env.step(fn_call_to_text(single_fn), conversation=chat))
+
+                if len(to_run) > 1 and all(is_read_only_action(f) for f in to_run):
+                    # Read-only calls are independent; the first runs alone so the runtime exists (or is restored)
+                    # before the fan-out. The rest never recover concurrently: once all have returned, any that failed
+                    # are retried one by one, so create/restore only ever runs on this thread
+                    observations = [run_step(to_run[0])]
+                    results = list(_TOOL_EXECUTOR.map(repo_env.try_step, [fn_call_to_text(f) for f in to_run[1:]]))
+                    for single_fn, result in zip(to_run[1:], results):
+                        observations.append(shape_tool_output(single_fn, result) if result is not None
+                                            else run_step(single_fn))
+                else:
+                    observations = [run_step(single_fn) for single_fn in to_run]
+
+                if stop_at < len(unique_fn_calls):
+                    single_fn = unique_fn_calls[stop_at]
                     if single_fn['name'] == 'ask_question':
                         question_to_ask = single_fn.get('arguments', {}).get('query')
                         question_to_ask = call_openai(
@@ -864,15 +1083,9 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
                         yield f"<|highlight|>{finish_message}<|/highlight|>"
                         yield f"<|highlight|>Agent has finished its work. You can send `/patch` to view the patch generated by the agent. For reference, a **golden patch** is provided in the instructions. Please compare them and check whether the agent’s work is correct.\n\nYou can ask follow-up questions to the agent, for example, to make further edits to improve the solution or to explain its changes. When you believe the problem has resolved, send `/stop` to end the conversation.<|/highlight|>"
                         return
-                    else:
-                        obs = repo_env.step(fn_call_to_text(single_fn), conversation=chat)
-                    observations.append(obs)
 
-                # Concatenate all observations
-                if len(observations) == 1:
-                    observation = observations[0]
-                else:
-                    observation = '\n\n---\n\n'.join(observations)
+                # Concatenate all observations; join sizes the result once and returns a lone string as-is
+                observation = '\n\n---\n\n'.join(observations)
 
                 yield {'info': f'runtime_id: {repo_env.runtime_id}'}
 
@@ -888,7 +1101,7 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
             hack_empty_tool += 1
             observation = "No function call was detected. You must call a tool (execute_bash, str_replace_editor, think, ask_question, or finish) to continue working on the repository. Use finish tool when the task is complete."
         yield '<|tool|>' + observation + '<|/tool|>'
-        chat.append({'role': 'user', 'content': observation})
+        chat.append({'role': 'user', 'content': compress_observation(observation)})
 
     return
 
@@ -1,6 +1,7 @@
+from functools import lru_cache
 from tool_handler import ToolHandler
-from tool_prompt import convert_tools_to_description, TOOL_PROMPT, search_tool, get_mcp_tools
-from prompter import CHATGPT_PROMPT, SEARCH_PROMPT
+from tool_prompt import convert_tools_to_description, render_tool_prompt, search_tool, get_mcp_tools
+from prompter import CHATGPT_PROMPT, get_search_prompt
 from utils import call_openai, keep_first_n_words, split_agent_markup
 
 MODEL_MAPPING = {
@@ -13,6 +14,13 @@ MODEL_MAPPING = {
 }
 
 
+@lru_cache(maxsize=64)
+def build_system_message(system_prompt, tool_description):
+    # Shared across requests; the same base prompt and tool set always yield the same message
+    return {'role': 'system',
+            'content': f"{system_prompt}\n\nYou have access to the following functions.\n\n{tool_description}"}
+
+
 def condense_history(conversation):
     new_conversation = []
     for turn in conversation:
@@ -42,7 +50,7 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
     if conversation[0]['role'] == 'system':
         system_prompt = conversation[0]['content']
     elif 'Search' in model:
-        system_prompt = SEARCH_PROMPT
+        system_prompt = get_search_prompt()
     else:
         system_prompt = CHATGPT_PROMPT
 
@@ -57,12 +65,12 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
 
     print(f"[agent_loop] Total tools available: {len(all_tools)} (including {len(mcp_tool_map)} MCP tools)")
 
-    tool_description = TOOL_PROMPT.format(description=convert_tools_to_description(all_tools))
-    system_prompt = system_prompt + '\n\nYou have access to the following functions.\n\n' + tool_description
+    tool_description = render_tool_prompt(convert_tools_to_description(all_tools))
+    system_message = build_system_message(system_prompt, tool_description)
     if conversation[0]['role'] == 'system':
-        chat = [{'role': 'system', 'content': system_prompt}] + conversation[1:]
+        chat = [system_message] + conversation[1:]
     else:
-        chat = [{'role': 'system', 'content': system_prompt}] + conversation
+        chat = [system_message] + conversation
 
     openai_client = call_openai()
     for _ in range(64):
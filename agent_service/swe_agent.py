@@ -1,7 +1,7 @@
-from utils import call_openai, BaseEnv, RuntimeServiceError, extract_fn_call, condense_history
-from tool_prompt import convert_tools_to_description, TOOL_PROMPT
+from utils import call_openai, BaseEnv, RuntimeServiceError, extract_fn_call, condense_history, load_swe_bench, \
+    SWE_BENCH_PATH
+from tool_prompt import convert_tools_to_description, render_tool_prompt
 import os
-import json
 
 OPENHANDS_SYSTEM_PROMPT = '''You are OpenHands agent, a helpful AI assistant that can interact with a computer to solve tasks.
 
@@ -250,16 +250,18 @@ The tool simply logs your thought process for better transparency and does not e
     return [execute_bash, str_replace_editor, think, finish]
 
 
+# Tool list and system prompt never change between requests, so build them once at import
+CODEACT_TOOLS = codeact_tool()
+SWE_SYSTEM_PROMPT = OPENHANDS_SYSTEM_PROMPT + "\n\n" + render_tool_prompt(convert_tools_to_description(CODEACT_TOOLS))
+
+
 class SWEEnv(BaseEnv):
     def __init__(self, instance_id=None):
         super().__init__(instance_id=instance_id)
         self.env_type = "swe"  # Set env_type for SWE environment
 
     def get_system_prompt(self):
-        tools_info = codeact_tool()
-        system_prompt = OPENHANDS_SYSTEM_PROMPT + "\n\n" + TOOL_PROMPT.format(
-            description=convert_tools_to_description(tools_info))
-        return system_prompt
+        return SWE_SYSTEM_PROMPT
 
     def get_canvas(self, instance_info=None):
         """Generate canvas with problem statement and context"""
@@ -273,15 +275,15 @@ class SWEEnv(BaseEnv):
         base_commit = instance_info.get('base_commit', '')
         oracle_patch = instance_info.get('patch', '')
 
-        canvas = "## SWE-bench Task\n\n"
-        canvas += f"**Instance ID:** `{instance_id}`  \n"
-        canvas += f"**Repository:** `{repo}`  \n"
+        parts = ["## SWE-bench Task\n\n",
+                 f"**Instance ID:** `{instance_id}`  \n",
+                 f"**Repository:** `{repo}`  \n"]
         # Add GitHub link on a new line if base_commit is available
         if base_commit:
-            canvas += f"**Base Commit:** [{base_commit[:8]}](https://github.com/{repo}/tree/{base_commit})  \n"
+            parts.append(f"**Base Commit:** [{base_commit[:8]}](https://github.com/{repo}/tree/{base_commit})  \n")
         if difficulty:
-            canvas += f"**Difficulty:** {difficulty}  \n"
-        canvas += "\n---\n\n"
+            parts.append(f"**Difficulty:** {difficulty}  \n")
+        parts.append("\n---\n\n")
 
         if problem_statement:
             # Problem statement is GitHub issue markdown
@@ -295,9 +297,7 @@ class SWEEnv(BaseEnv):
             problem_cleaned = problem_cleaned.replace('\n# ', '\n### ')
             problem_cleaned = problem_cleaned.replace('\n## ', '\n#### ')
             problem_cleaned = problem_cleaned.replace('\n### ', '\n##### ')
-            canvas += "### Problem Statement\n\n"
-            canvas += problem_cleaned + "\n\n"
-            canvas += "---\n\n"
+            parts += ["### Problem Statement\n\n", problem_cleaned, "\n\n", "---\n\n"]
 
         if hints_text:
             # Hints might contain markdown or plain text
@@ -306,18 +306,14 @@ class SWEEnv(BaseEnv):
             hints_cleaned = hints_cleaned.replace('\n# ', '\n### ')
             hints_cleaned = hints_cleaned.replace('\n## ', '\n#### ')
             hints_cleaned = hints_cleaned.replace('\n### ', '\n##### ')
-            canvas += "### Hints\n\n"
-            canvas += hints_cleaned + "\n\n"
-            canvas += "---\n\n"
+            parts += ["### Hints\n\n", hints_cleaned, "\n\n", "---\n\n"]
 
         if oracle_patch:
             # Patch is a diff format, display in diff code block
-            canvas += "### Golden Patch\n\n"
-            canvas += f"```diff\n{oracle_patch}\n```\n\n"
-            canvas += "---\n\n"
+            parts += ["### Golden Patch\n\n", f"```diff\n{oracle_patch}\n```\n\n", "---\n\n"]
 
-        canvas += f"**Runtime ID:** `{self.runtime_id}`\n\n"
-        return canvas
+        parts.append(f"**Runtime ID:** `{self.runtime_id}`\n\n")
+        return "".join(parts)
 
 
 def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_servers=None, enabled_tools=None,
@@ -343,19 +339,15 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
                 instance_id = line[len('instance_id:'):].strip()
 
     # Load instance data from SWE-bench dataset
-
-    data_path = os.path.join(os.path.dirname(__file__), "data", "swe_bench_verified.json")
-
-    if not os.path.exists(data_path):
+    if not os.path.exists(SWE_BENCH_PATH):
         yield "⚠️ **SWE-bench dataset not found**\n\nPlease ensure swe_bench_verified.json exists in agent_service/data/"
         return
 
-    with open(data_path, 'r') as f:
-        swe_data = json.load(f)
+    swe_data, swe_index = load_swe_bench()
 
     # Find instance by instance_id, or pick random if not specified
     if instance_id:
-        instance_info = next((item for item in swe_data if item.get('instance_id') == instance_id), None)
+        instance_info = swe_index.get(instance_id)
         if instance_info is None:
             yield f"⚠️ **Instance not found**\n\nInstance ID '{instance_id}' not found in SWE-bench dataset."
             return
@@ -387,12 +379,12 @@ def agent_loop(conversation, cancel_event=None, meta_info="", user_id=None, mcp_
         yield '<|canvas|>' + swe_env.get_canvas(instance_info) + '<|/canvas|>'
 
     # Special handling for \repo command
-    if len(conversation) == 1 and (conversation[0]['content'].startswith("\\swe") or conversation[0]['content'].startswith("/swe")):
+    if len(conversation) == 1 and conversation[0]['content'].startswith(("\\swe", "/swe")):
         yield "Hi there. How can I help you today?"
         return
 
     last_content = conversation[-1]['content']
-    if last_content == '\\reward' or last_content == '/reward' or '###STOP###' in last_content:
+    if last_content in ('\\reward', '/reward') or '###STOP###' in last_content:
         try:
             reward = swe_env.get_reward(
                 label_answer=instance_info.get('patch', ''),
@@ -0,0 +1,99 @@
+from repo_agent import shape_tool_output, compress_observation, summarize_reasoning, is_read_only_action, \
+    _extract_token, find_latest_summary, _condense_turn, prepare_conversation, _NEWLINE_RUN_RE, \
+    _SUMMARY_LEFT_KEY, _SUMMARY_RIGHT_KEY, _MAX_BASH_OUTPUT_CHARS
+
+
+DIFF = "diff --git a/m.py b/m.py\n@@ -1,5 +1,5 @@\n def f():\n    \n\n\n-    return 1\n+    return 2\n \n"
+
+
+def bash(command):
+    return {'name': 'execute_bash', 'arguments': {'command': command}}
+
+
+def editor(command, **arguments):
+    return {'name': 'str_replace_editor', 'arguments': {'command': command, 'path': '/repo/m.py', **arguments}}
+
+
+def test_diff_context_preserved():
+    assert shape_tool_output(bash('git diff'), DIFF) == DIFF
+    assert compress_observation(DIFF) == DIFF
+
+
+def test_edit_output_untouched():
+    output = "The file /repo/m.py has been edited.\n   1\tdef f():\n   2\t    \n\n\n\n   3\t    return 2\n"
+    assert shape_tool_output(editor('str_replace', old_str='1', new_str='2'), output) == output
+
+
+def test_view_collapses_empty_lines():
+    output = "   1\tdef f():\n\n\n\n   5\t    return 1\n    \n"
+    assert shape_tool_output(editor('view'), output) == "   1\tdef f():\n\n   5\t    return 1\n    \n"
+
+
+def test_long_bash_output_keeps_head_and_tail():
+    output = 'a' * 5000 + 'b' * 3000
+    shaped = shape_tool_output(bash('pytest'), output)
+    assert shaped.startswith('a' * 3000 + '\n… 4000 characters omitted …\n')
+    assert shaped.endswith('b' * 1000)
+    short = 'x' * _MAX_BASH_OUTPUT_CHARS
+    assert shape_tool_output(bash('pytest'), short) == short
+
+
+def test_summarize_reasoning_matches_previous_output():
+    def previous(raw):
+        reasoning = _NEWLINE_RUN_RE.sub('\n', raw.strip())
+        paragraphs = [p.strip() for p in reasoning.split('\n\n') if p.strip()]
+        return (f"{paragraphs[0]}\n\n...\n\n{paragraphs[-1]}" if len(paragraphs) > 2 else
+                '\n\n'.join(paragraphs) if paragraphs else
+                f"{reasoning[:100]}\n\n...\n\n{reasoning[-100:]}" if len(reasoning) > 250 else reasoning)
+
+    for raw in ['', '   ', 'one line', 'first\n\nsecond\n\n\nthird\n\nlast', '  a\n \n\nb  ', 'x' * 400]:
+        assert summarize_reasoning(_NEWLINE_RUN_RE.sub('\n', raw.strip())) == previous(raw)
+    assert summarize_reasoning('first\n\n second \n\nthird') == 'first\n\n...\n\nthird'
+
+
+def test_is_read_only_action():
+    assert is_read_only_action(bash('ls -la /repo'))
+    assert is_read_only_action(bash('git diff HEAD'))
+    assert is_read_only_action(editor('view'))
+    assert is_read_only_action({'name': 'think', 'arguments': {'thought': 'x'}})
+    assert not is_read_only_action(bash('cat a > b'))
+    assert not is_read_only_action(bash('ls && rm -rf x'))
+    assert not is_read_only_action(bash('find . -name "*.pyc" -delete'))
+    assert not is_read_only_action(bash('python setup.py'))
+    assert not is_read_only_action(editor('str_replace', old_str='a', new_str='b'))
+
+
+def test_extract_token():
+    assert _extract_token('instance_id: django__django-11099 more', 'instance_id:') is None
+    assert _extract_token('instance_id:django__django-11099 more', 'instance_id:') == 'django__django-11099'
+    assert _extract_token('instance_id: \ninstance_id:x-3\n', 'instance_id:') == 'x-3'
+    assert _extract_token('nothing here', 'instance_id:') is None
+
+
+def test_condense_turn_drops_markup_and_compresses_tool_output():
+    turn = {'role': 'assistant', 'content': '<|think|>hidden<|/think|>Looking.<|tool|>' + DIFF + '<|/tool|>'}
+    new_conversation = []
+    _condense_turn(turn, new_conversation)
+    assert new_conversation == [{'role': 'assistant', 'content': 'Looking.'},
+                                {'role': 'user', 'content': compress_observation(DIFF)}]
+
+
+def test_summary_found_in_rebuilt_history():
+    summary = f"{_SUMMARY_LEFT_KEY}fixed f{_SUMMARY_RIGHT_KEY}"
+    conversation = [
+        {'role': 'user', 'content': '\\repo instance_id:x-3'},
+        {'role': 'assistant', 'content': 'Setting up.'},
+        {'role': 'user', 'content': 'go'},
+        {'role': 'assistant', 'content': 'old work<|tool|>old output<|/tool|>'},
+        {'role': 'assistant', 'content': summary + 'next step<|tool|>' + DIFF + '<|/tool|>'},
+        {'role': 'user', 'content': 'thanks'},
+    ]
+    idx, replacement = find_latest_summary(conversation)
+    assert idx == 4
+    assert replacement == [{'role': 'user', 'content': summary.replace('<|think|>', '').replace('<|/think|>', '')},
+                           {'role': 'assistant', 'content': 'next step<|tool|>' + DIFF + '<|/tool|>'}]
+
+    rebuilt = prepare_conversation(conversation)
+    assert [turn['content'] for turn in rebuilt] == [
+        '\\repo instance_id:x-3', 'Setting up.', 'go', replacement[0]['content'], 'next step', DIFF, 'thanks']
+    assert find_latest_summary(conversation[:4]) == (2, [])
@@ -198,6 +198,13 @@ Reminder:
 </IMPORTANT>
 """
 
+# TOOL_PROMPT has a single {description} field; split once so rendering is a plain concatenation
+_TOOL_PROMPT_PREFIX, _TOOL_PROMPT_SUFFIX = TOOL_PROMPT.split('{description}', 1)
+
+
+def render_tool_prompt(description: str) -> str:
+    return f"{_TOOL_PROMPT_PREFIX}{description}{_TOOL_PROMPT_SUFFIX}"
+
 PARALLEL_TOOL_PROMPT = """
 You have access to the following functions:
 
@@ -2,11 +2,50 @@ import os
 import re
 import requests
 import json
+import threading
+import time
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
 from openai import OpenAI
 
+# orjson is optional (the `fast` extra); fall back to the stdlib when it is not installed
+try:
+    import orjson
+
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    def json_encode(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+    def json_encode(obj):
+        return json.dumps(obj).encode()
+
+# For request bodies sent pre-encoded with data=json_encode(...)
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
 BASE_DOMAIN = os.getenv("BASE_DOMAIN", "localhost")
 RUNTIME_SERVICE_URL = os.getenv("RUNTIME_SERVICE_URL", f"http://{BASE_DOMAIN}:8005")
 
+# Shared keep-alive connection pool for runtime service calls (one per process, reused by every env)
+RUNTIME_SESSION = requests.Session()
+RUNTIME_SESSION.mount('http://', HTTPAdapter(pool_connections=32, pool_maxsize=64))
+RUNTIME_SESSION.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=64))
+
+@lru_cache(maxsize=8)
+def _openai_client(api_key):
+    # One client (and connection pool) per key, shared by every session and thread
+    client = OpenAI(api_key=api_key)
+    print("OpenAI client initialized successfully")
+    return client
+
+
 def call_openai(prompt=None):
     OPENAI_API_KEY = None
     try:
@@ -16,8 +55,7 @@ def call_openai(prompt=None):
 
     openai_client = None
     if OPENAI_API_KEY:
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-        print("OpenAI client initialized successfully")
+        openai_client = _openai_client(OPENAI_API_KEY)
     if prompt is None:
         return openai_client
     else:
@@ -36,6 +74,16 @@ def call_openai(prompt=None):
 
 
 
+# Tool-call patterns, compiled once since extract_fn_call runs on every model turn
+_SECTION_MARK_RE = re.compile(r'<\[[^\]]+\]>')
+_FN_CALL_RE = re.compile(r'(?m)^[ \t]*<function=([^>]+)>\s*(.*?)\s*</function>', re.DOTALL)
+_FN_START_RE = re.compile(r'(?m)^[ \t]*<function=([^>]+)>')
+_UNNAMED_PARAM_RE = re.compile(r'<parameter>([^<]*)</parameter>')
+_OPEN_PARAM_RE = re.compile(r'<parameter=[^>]+>')
+_PARAM_RE = re.compile(r'<parameter=([^>]+)>(.*?)</parameter>', re.DOTALL)
+_XML_PARAM_RE = re.compile(r'<([a-z_][a-z0-9_]*)>(.*?)</\1>', re.DOTALL | re.IGNORECASE)
+
+
 def extract_fn_call(text):
     """
     Extract function calls from text. Returns:
@@ -49,23 +97,19 @@ def extract_fn_call(text):
     """
     if not text:
         return None
-    text = re.split(r'<\[[^\]]+\]>', text)[-1].strip()
+    text = _SECTION_MARK_RE.split(text)[-1].strip()
 
     # Only accept <function=name> format for function names
-    matches = list(re.finditer(
-        r'(?m)^[ \t]*<function=([^>]+)>\s*(.*?)\s*</function>',
-        text,
-        re.DOTALL
-    ))
+    matches = list(_FN_CALL_RE.finditer(text))
 
     if not matches:
         # Check for incomplete function call
-        fn_start = re.search(r'(?m)^[ \t]*<function=([^>]+)>', text)
+        fn_start = _FN_START_RE.search(text)
         if fn_start:
             fn_name = fn_start.group(1)
 
             # Check for wrong closing tag format: </function=...> instead of </function>
-            wrong_close_function = re.search(r'</function=', text)
+            wrong_close_function = '</function=' in text
             if wrong_close_function:
                 return {
                     'error': f"""**Tool Call Format Error**
@@ -90,7 +134,7 @@ The closing tag should simply be `</function>` without any `=` or name."""
                 }
 
             # First check for wrong format: <parameter>value</parameter> instead of <parameter=name>value</parameter>
-            wrong_param_format = re.findall(r'<parameter>([^<]*)</parameter>', text)
+            wrong_param_format = _UNNAMED_PARAM_RE.findall(text)
             if wrong_param_format:
                 return {
                     'error': f"""**Tool Call Format Error**
@@ -114,9 +158,9 @@ You used `<parameter>` without specifying the parameter name. The parameter name
 Please use `<parameter=PARAM_NAME>value</parameter>` format. The parameter name (e.g., `message`, `command`, `path`) must be specified in the opening tag like `<parameter=message>`."""
                 }
 
-            open_params = len(re.findall(r'<parameter=[^>]+>', text))
-            close_params = len(re.findall(r'</parameter>', text))
-            has_close_function = bool(re.search(r'</function>', text))
+            open_params = len(_OPEN_PARAM_RE.findall(text))
+            close_params = text.count('</parameter>')
+            has_close_function = '</function>' in text
 
             if (open_params != close_params) or (not has_close_function):
                 return {
@@ -149,7 +193,7 @@ Please make sure every `<parameter=...>` has a matching `</parameter>`, and ever
         fn_name = m.group(1)
 
         # First check for wrong format: <parameter>value</parameter> instead of <parameter=name>value</parameter>
-        wrong_param_format = re.findall(r'<parameter>([^<]*)</parameter>', fn_body)
+        wrong_param_format = _UNNAMED_PARAM_RE.findall(fn_body)
         if wrong_param_format:
             preview = wrong_param_format[0][:50].replace('\n', ' ')
             return {
@@ -175,8 +219,8 @@ Please use `<parameter=PARAM_NAME>value</parameter>` format. The parameter name
             }
 
         # Check for incomplete parameters
-        open_params = len(re.findall(r'<parameter=[^>]+>', fn_body))
-        close_params = len(re.findall(r'</parameter>', fn_body))
+        open_params = len(_OPEN_PARAM_RE.findall(fn_body))
+        close_params = fn_body.count('</parameter>')
         if open_params != close_params:
             return {
                 'error': f"""**Tool Call Format Error**
@@ -213,14 +257,10 @@ Please make sure every `<parameter=...>` has a matching `</parameter>`."""
         fn_name = m.group(1)
 
         # Extract standard format parameters: <parameter=name>value</parameter>
-        standard_params = dict(re.findall(
-            r'<parameter=([^>]+)>(.*?)</parameter>',
-            fn_body,
-            re.DOTALL
-        ))
+        standard_params = dict(_PARAM_RE.findall(fn_body))
 
         # Extract XML-style parameters: <name>value</name> (but exclude 'parameter' and 'function' tags)
-        xml_params = re.findall(r'<([a-z_][a-z0-9_]*)>(.*?)</\1>', fn_body, re.DOTALL | re.IGNORECASE)
+        xml_params = _XML_PARAM_RE.findall(fn_body)
         xml_params_dict = {}
         for param_name, param_value in xml_params:
             # Skip 'parameter' and 'function' tags (these are structural, not parameters)
@@ -284,6 +324,9 @@ class RuntimeServiceError(Exception):
 
 
 class BaseEnv:
+    # Subclasses that add their own attributes simply keep a __dict__
+    __slots__ = ('params', 'runtime_id', 'meta_info', 'env_type')
+
     # Retry configuration
     MAX_RETRY_TIME = 30  # Total time to retry in seconds
     RETRY_DELAY = 2  # Delay between retries in seconds
@@ -296,7 +339,6 @@ class BaseEnv:
 
     def _request_with_retry(self, method, url, **kwargs):
         """Make HTTP request with retry logic (30s total timeout)."""
-        import time
         start_time = time.time()
         last_error = None
         attempt = 0
@@ -304,7 +346,7 @@ class BaseEnv:
         while time.time() - start_time < self.MAX_RETRY_TIME:
             attempt += 1
             try:
-                response = requests.request(method, url, **kwargs)
+                response = RUNTIME_SESSION.request(method, url, **kwargs)
                 response.raise_for_status()
                 return response
             except requests.exceptions.ConnectionError as e:
@@ -351,22 +393,57 @@ class BaseEnv:
         params = self.params
         response = self._request_with_retry(
             'POST', f"{RUNTIME_SERVICE_URL}/create",
-            json={"env_type": env_type, "params": json.dumps(params)},
+            data=json_encode({"env_type": env_type, "params": json_dumps(params)}), headers=JSON_HEADERS,
             timeout=300
         )
-        result = response.json()
+        result = json_loads(response.content)
         self.runtime_id = result['runtime_id']
-        self.meta_info = json.loads(result['meta_info'])
+        self.meta_info = json_loads(result['meta_info'])
         return self.meta_info
 
-    def _execute_step(self, fn_call: dict):
-        """Execute single step with retry."""
+    def _execute_step(self, fn_call: dict, check_exists=False):
+        """Execute single step with retry.
+        With check_exists, returns None instead of failing when the runtime no longer exists."""
+        payload = {"runtime_id": self.runtime_id, "params": json_dumps(fn_call)}
+        if check_exists:
+            payload["check_exists"] = True
         response = self._request_with_retry(
             'POST', f"{RUNTIME_SERVICE_URL}/step",
-            json={"runtime_id": self.runtime_id, "params": json.dumps(fn_call)},
+            data=json_encode(payload), headers=JSON_HEADERS,
             timeout=600
         )
-        return response.json()['result']
+        data = json_loads(response.content)
+        if data.get('needs_restore'):
+            return None
+        return data['result']
+
+    def _execute_batch(self, fn_calls: list):
+        """Execute several steps in order with a single request. Returns one result (or None) per step."""
+        response = self._request_with_retry(
+            'POST', f"{RUNTIME_SERVICE_URL}/step_batch",
+            data=json_encode({"runtime_id": self.runtime_id, "params": [json_dumps(fn_call) for fn_call in fn_calls]}),
+            headers=JSON_HEADERS,
+            timeout=600 * max(1, len(fn_calls))
+        )
+        return json_loads(response.content)['results']
+
+    def _replay_steps(self, fn_calls: list):
+        """Replay steps, ignoring failures of individual steps; falls back to one request per step if /step_batch
+        is unavailable. Raises if the batch itself fails, rather than leaving a runtime with no edits replayed
+        (a per-step retry could apply the part of the batch that already ran twice)."""
+        if not fn_calls:
+            return
+        try:
+            self._execute_batch(fn_calls)
+            return
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+        for fn_call in fn_calls:
+            try:
+                self._execute_step(fn_call)
+            except Exception:
+                pass  # Continue replaying even if some steps fail
 
     def get_reward(self, **kwargs):
         """Get reward from environment with retry."""
@@ -389,33 +466,25 @@ class BaseEnv:
 
         # Recreate environment and replay
         self.create()
-        for fn_call in actions:
-            try:
-                self._execute_step(fn_call)
-            except Exception:
-                pass  # Continue replaying even if some steps fail
+        self._replay_steps(actions)
 
     def step(self, fn_call: dict, conversation=None):
         """Execute step with automatic recovery."""
         if not self.runtime_id:
             self.create()
 
-        # Ping and restore if needed
-        if not self.ping()['exists']:
-            if conversation:
-                self.restore(conversation)
-            else:
-                self.create()
-
-        # Execute step with retry
+        # Existence is checked by the step call itself; restore and retry if the runtime is gone or the step fails
         try:
-            return self._execute_step(fn_call)
+            result = self._execute_step(fn_call, check_exists=True)
+            if result is not None:
+                return result
         except Exception:
-            if conversation:
-                self.restore(conversation)
-            else:
-                self.create()
-            return self._execute_step(fn_call)
+            pass
+        if conversation:
+            self.restore(conversation)
+        else:
+            self.create()
+        return self._execute_step(fn_call)
 
     def initialize(self, existing_runtime_id=None, conversation=None):
         """Initialize environment, validating existing_runtime_id or restoring from conversation.
@@ -446,7 +515,7 @@ class BaseEnv:
 
 
 import re
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 _TAG_RE = re.compile(r"<\|(think|tool|canvas|highlight|survey|note)\|>(.*?)<\|/\1\|>", re.DOTALL)
 
@@ -477,11 +546,26 @@ def split_agent_markup(s: str) -> List[Dict[str, str]]:
     return merged
 
 
+@lru_cache(maxsize=1024)
+def split_agent_markup_cached(s: str) -> Tuple[Tuple[str, str], ...]:
+    """Memoized split_agent_markup returning immutable (role, content) pairs.
+    History is re-condensed on every request, so the same assistant turns are parsed repeatedly."""
+    return tuple((chunk["role"], chunk["content"]) for chunk in split_agent_markup(s))
+
+
+_WORD_RE = re.compile(r'\S+')
+
+
+@lru_cache(maxsize=1024)
 def keep_first_n_words(text: str, n: int = 1000) -> str:
+    # Cached because history tool outputs come back identical (from split_agent_markup_cached) on every request
     if not text:
         return ""
+    # n words need at least 2n-1 characters, so shorter text can never be truncated
+    if len(text) < 2 * n - 1:
+        return text
     count = 0
-    for m in re.finditer(r'\S+', text):
+    for m in _WORD_RE.finditer(text):
         count += 1
         if count == n:
             return text[:m.end()] + '\n[Document is truncated.]'
@@ -492,25 +576,24 @@ def condense_history(conversation):
     new_conversation = []
     for turn in conversation:
         if turn['role'] == 'assistant':
-            split_turn = split_agent_markup(turn['content'])
-            for sub_turn in split_turn:
-                if sub_turn['role'] == 'think':
+            for role, content in split_agent_markup_cached(turn['content']):
+                if role == 'think':
                     continue
-                elif sub_turn['role'] == 'canvas':
+                elif role == 'canvas':
                     continue
-                elif sub_turn['role'] == 'highlight':
+                elif role == 'highlight':
                     continue
-                elif sub_turn['role'] == 'text':
-                    new_conversation.append({'role': 'assistant', 'content': sub_turn['content']})
-                elif sub_turn['role'] == 'tool':
-                    new_conversation.append({'role': 'user', 'content': sub_turn['content']})
+                elif role == 'text':
+                    new_conversation.append({'role': 'assistant', 'content': content})
+                elif role == 'tool':
+                    new_conversation.append({'role': 'user', 'content': content})
         else:
             new_conversation.append(turn)
     return new_conversation
 
 
+@lru_cache(maxsize=1024)
 def clean_markdown(text):
-    import re
     text = text.strip()
     # Remove setext-style heading markers (lines of === or ---)
     text = re.sub(r'\n={3,}\n', '\n\n', text)
@@ -534,6 +617,30 @@ def clean_markdown(text):
     return ''.join(result)
 
 
+SWE_BENCH_PATH = os.path.join(os.path.dirname(__file__), "data", "swe_bench_verified.json")
+
+# Cache SWE-bench dataset at module level (shared by repo_agent and swe_agent)
+_swe_bench_data = None
+_swe_bench_index = None
+_swe_bench_lock = threading.Lock()
+
+
+def load_swe_bench():
+    """Load SWE-bench once per process. Returns (instances, {instance_id: instance})."""
+    global _swe_bench_data, _swe_bench_index
+    if _swe_bench_data is None:
+        with _swe_bench_lock:
+            if _swe_bench_data is None:
+                with open(SWE_BENCH_PATH, 'rb') as f:
+                    data = json_loads(f.read())
+                index = {}
+                for item in data:
+                    index.setdefault(item.get('instance_id'), item)
+                _swe_bench_index = index
+                _swe_bench_data = data
+    return _swe_bench_data, _swe_bench_index
+
+
 # Cache tokenizer at module level
 _swe_tokenizer = None
 
@@ -560,9 +667,7 @@ def get_context_length(conversation):
     def count_tokens(text):
         if tokenizer:
             return len(tokenizer.encode(text))
-        else:
-            import re
-            return len(re.findall(r'\S+', text))
+        return len(_WORD_RE.findall(text))
 
     return sum(count_tokens(turn.get('content', '')) for turn in conversation)
 
@@ -580,8 +685,7 @@ def swe_context_condenser(conversation, target=10000):
         if tokenizer:
             return len(tokenizer.encode(text))
         else:
-            import re
-            return len(re.findall(r'\S+', text))
+            return len(_WORD_RE.findall(text))
 
     def total_token_count(conv):
         return sum(count_tokens(turn.get('content', '')) for turn in conv)
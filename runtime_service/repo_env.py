@@ -4,6 +4,7 @@ import copy
 import json
 import os
 import re
+import threading
 import time
 import uuid
 from itertools import groupby
@@ -37,15 +38,27 @@ def get_agent_env_from_str(env_str: str):
         raise NotImplementedError(f"Unknown env_str: {env_str}")
 
 
+def get_agent_env_from_spec(env_spec: dict):
+    # Structured counterpart of get_agent_env_from_str: {'type': prefix, 'payload': instance_info}
+    env_cls = ENV_PREFIX_MAP.get(env_spec.get('type'))
+    if env_cls is None or not hasattr(env_cls, "from_env_spec"):
+        raise NotImplementedError(f"Unknown env_spec type: {env_spec.get('type')}")
+    return env_cls.from_env_spec(env_spec['payload'])
+
 
 class GymEnv:
     # Gym stype env wrapper
-    def __init__(self, env_str):
+    def __init__(self, env_str=None, env_spec=None):
         self.env_str = env_str
-        self.gym = get_agent_env_from_str(env_str)
+        if env_spec is not None:
+            self.gym = get_agent_env_from_spec(env_spec)
+        else:
+            self.gym = get_agent_env_from_str(env_str)
         self.instance_info = self.gym.instance_info
         self.stats = collections.Counter()
         self.stats['finish'] = 0
+        # Read-only steps of one turn may run concurrently on this env, so counters are updated under a lock
+        self._stats_lock = threading.Lock()
         self.env_fail = False
 
     async def init_env(self, item):
@@ -63,7 +76,8 @@ class GymEnv:
                 print(f"ERROR: Server initialization timeout after ({cc}s)")
                 break
             await asyncio.sleep(1)
-        self.stats['env_init_time'] = int(time.time() - start_env)
+        with self._stats_lock:
+            self.stats['env_init_time'] = int(time.time() - start_env)
         print('ENV START COST', time.time() - start_env)
 
     async def get_data(self, item, context):
@@ -89,7 +103,8 @@ class GymEnv:
         return conversations, {'max_turn': 100, 'instance_info': self.instance_info, 'meta_info': meta_info}
 
     async def run_action(self, response):
-        self.stats['action'] += 1
+        with self._stats_lock:
+            self.stats['action'] += 1
         success, observation = await asyncio.to_thread(self.gym.step, response)
         if observation == "Task finished":
             return {'observation': 'finish'}
@@ -116,7 +131,8 @@ class GymEnv:
         out.non_tensor_batch["tag"] = np.array([tag, ], dtype=object)
         out.non_tensor_batch["is_summary"] = np.array([int("summary" in tag), ], dtype=object)
         out.non_tensor_batch["traj_cnt"] = np.array([1, ], dtype=object)
-        stats = dict(self.stats)
+        with self._stats_lock:
+            stats = dict(self.stats)
         extra_data = {"score": score, "call_fail": self.env_fail, "action_fail": 0, "answer_reached": True,
                       "stats": stats}
         out.non_tensor_batch['extra_data'] = np.array([extra_data, ], dtype=object)
@@ -157,10 +173,10 @@ class SimpleHttpClient:
         except json.JSONDecodeError:
             return {'content': response.text} if response.text else {}
 
-    def post(self, endpoint, data=None):
-        """Make POST request"""
+    def post(self, endpoint, data=None, timeout=None):
+        """Make POST request (timeout overrides the client default for this call only)"""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
-        response = self.session.post(url, json=data, timeout=self.timeout)
+        response = self.session.post(url, json=data, timeout=self.timeout if timeout is None else timeout)
         response.raise_for_status()
 
         try:
@@ -1759,10 +1775,10 @@ class NewRepairEnv:
     """
     env_str_prefix = "NewRepairEnv"
 
-    def __init__(self, env_str, service_url, **kwargs):
+    def __init__(self, env_str, service_url, instance_info=None, **kwargs):
         self.session_id = str(uuid.uuid4())
         self.env_str = env_str
-        self.instance_info = json.loads(self.env_str)
+        self.instance_info = instance_info if instance_info is not None else json.loads(self.env_str)
         self.service_url = service_url
         self.kwargs = kwargs
         self.instance_id = self.instance_info.get('instance_id', 'default')
@@ -1773,6 +1789,8 @@ class NewRepairEnv:
         # Working directory with symlinks - created lazily on first edit
         self.working_dir = None
         self._working_dir_initialized = False
+        # Read-only steps of one turn may run concurrently; only one of them may create the working dir
+        self._working_dir_lock = threading.Lock()
         
         # Track original content for git diff generation
         self.file_originals = {}  # {path: original_content}
@@ -1793,11 +1811,21 @@ class NewRepairEnv:
         service_url = os.getenv('LOC_IP_ADDRESS', 'http://localhost:8011')
         return cls(env_str=env_str, service_url=service_url, **kwargs)
 
+    @classmethod
+    def from_env_spec(cls, instance_info: dict, **kwargs):
+        """Create environment from an already-parsed instance_info dict"""
+        service_url = os.getenv('LOC_IP_ADDRESS', 'http://localhost:8011')
+        return cls(env_str=None, service_url=service_url, instance_info=instance_info, **kwargs)
+
     def _ensure_working_dir(self):
         """Create working directory with actual copy of repo"""
         if self._working_dir_initialized:
             return
-        
+        with self._working_dir_lock:
+            if not self._working_dir_initialized:
+                self._create_working_dir()
+
+    def _create_working_dir(self):
         import subprocess
         import shutil
         
@@ -1902,12 +1930,8 @@ class NewRepairEnv:
         max_retries = 3
         timeout = 120
 
-        original_timeout = self.client.timeout
-
         for attempt in range(max_retries):
             try:
-                self.client.timeout = timeout
-
                 endpoint = f"api/v1/actions/{provider}"
                 payload = {
                     "action_id": action_id,
@@ -1915,8 +1939,8 @@ class NewRepairEnv:
                     "base_dir": self.working_dir  # Use working_dir instead of base_dir
                 }
 
-                response = self.client.post(endpoint, payload)
-                self.client.timeout = original_timeout
+                # Per-call timeout: concurrent steps share self.client, so its default is never mutated
+                response = self.client.post(endpoint, payload, timeout=timeout)
                 
                 if isinstance(response, dict):
                     result = response.get('result', response.get('content', str(response)))
@@ -1926,7 +1950,6 @@ class NewRepairEnv:
                 return str(response)
 
             except Exception as e:
-                self.client.timeout = original_timeout
                 if attempt < max_retries - 1:
                     import time
                     time.sleep(1)
@@ -2328,11 +2351,11 @@ class NewRepairEnv:
         self.release()
 
 
-def create_env(env_str=None):
+def create_env(env_str=None, env_spec=None):
     # Set LOC_IP_ADDRESS to repo_server port if not already set
     if 'LOC_IP_ADDRESS' not in os.environ:
         os.environ['LOC_IP_ADDRESS'] = 'http://localhost:8011'
-    env = GymEnv(env_str)
+    env = GymEnv(env_str=env_str, env_spec=env_spec)
     return env, json.dumps(env.instance_info)
 
 
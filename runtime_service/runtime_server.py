@@ -3,7 +3,7 @@ import json
 import asyncio
 import time
 import inspect
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, Optional, Callable, List
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import uvicorn
@@ -66,10 +66,21 @@ class CreateEnvResponse(BaseModel):
 class StepRequest(BaseModel):
     runtime_id: str
     params: str  # JSON string of step parameters
+    check_exists: bool = False  # If set, a missing runtime returns needs_restore instead of 404
 
 
 class StepResponse(BaseModel):
-    result: str  # JSON string with step result
+    result: str = ""  # JSON string with step result
+    needs_restore: bool = False  # Runtime was not found (only when check_exists is set)
+
+
+class StepBatchRequest(BaseModel):
+    runtime_id: str
+    params: List[str]  # JSON strings of step parameters, executed in order
+
+
+class StepBatchResponse(BaseModel):
+    results: List[Optional[str]]  # JSON string per step, None if that step failed
 
 
 class RewardRequest(BaseModel):
@@ -179,6 +190,23 @@ class RuntimeManager:
         else:
             return json.dumps(result)
 
+    async def step_batch(self, runtime_id: str, params_list: List[str]) -> List[Optional[str]]:
+        """
+        Execute several steps in order within a single request (e.g. replaying history).
+        A failing step is recorded as None and does not stop the remaining steps.
+        """
+        if runtime_id not in self.environments:
+            raise ValueError(f"Runtime ID {runtime_id} not found")
+
+        results = []
+        for params_str in params_list:
+            try:
+                results.append(await self.step(runtime_id, params_str))
+            except Exception as e:
+                print(f"Step in batch failed for {runtime_id}: {e!r}")
+                results.append(None)
+        return results
+
     async def get_reward(self, runtime_id: str, params_str: str = "{}") -> float:
         """
         Get reward from the environment.
@@ -446,12 +474,17 @@ async def step_environment(request: StepRequest):
     This operation runs in background thread pool, so multiple
     step requests can run in parallel without blocking.
 
+    With check_exists set, a missing runtime is reported as needs_restore=True
+    so clients can skip a separate /ping round-trip before each step.
+
     Example:
     {
         "runtime_id": "550e8400-e29b-41d4-a716-446655440000",
         "params": "{\"name\": \"search_direct_flight\", \"arguments\": {\"departure_airport\": \"JFK\"}}"
     }
     """
+    if request.check_exists and runtime_manager.get_env_data(request.runtime_id) is None:
+        return StepResponse(needs_restore=True)
     try:
         result = await runtime_manager.step(request.runtime_id, request.params)
 
@@ -466,6 +499,33 @@ async def step_environment(request: StepRequest):
         raise HTTPException(status_code=500, detail=f"Failed to execute step: {str(e)}")
 
 
+@app.post("/step_batch", response_model=StepBatchResponse)
+async def step_batch_environment(request: StepBatchRequest):
+    """
+    Execute a list of steps in order with one round-trip.
+
+    Used to replay a conversation's actions after a runtime has been recreated.
+    Each entry of params is a JSON string, as in /step. Failed steps return None.
+
+    Example:
+    {
+        "runtime_id": "550e8400-e29b-41d4-a716-446655440000",
+        "params": ["{\"response\": \"...\"}", "{\"response\": \"...\"}"]
+    }
+    """
+    try:
+        results = await runtime_manager.step_batch(request.runtime_id, request.params)
+
+        return StepBatchResponse(results=results)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        import traceback
+        print(f"Error in step_batch_environment: {e!r}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to execute steps: {str(e)}")
+
+
 @app.post("/reward", response_model=RewardResponse)
 async def get_reward(request: RewardRequest):
     """
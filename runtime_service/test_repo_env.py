@@ -0,0 +1,32 @@
+import asyncio
+import os
+
+import repo_env
+
+N_STEPS = 16
+
+
+def view_action(path):
+    return f"<function=str_replace_editor><parameter=command>view</parameter><parameter=path>{path}</parameter></function>"
+
+
+def test_concurrent_read_only_steps(tmp_path, monkeypatch):
+    base_dir, cache_dir = tmp_path / 'gym_data', tmp_path / 'repo_working'
+    (base_dir / 'demo' / 'testbed').mkdir(parents=True)
+    (base_dir / 'demo' / 'testbed' / 'a.py').write_text('def f():\n    return 1\n')
+    monkeypatch.setenv('BASE_DIR_PATH', str(base_dir))
+    monkeypatch.setenv('REPO_CACHE_DIR', str(cache_dir))
+
+    env, _ = repo_env.create_env(env_spec={'type': 'NewRepairEnv', 'payload': {'instance_id': 'demo'}})
+
+    async def run_all():
+        # run_action hands each step to a worker thread, so these really overlap on one env
+        return await asyncio.gather(*(repo_env.env_step(env, {'response': view_action('/testbed/a.py')})
+                                      for _ in range(N_STEPS)))
+
+    observations = asyncio.run(run_all())
+    assert observations == ['   1 | def f():\n   2 |     return 1'] * N_STEPS
+    assert env.stats['action'] == N_STEPS
+    # Only one of the concurrent steps created the working directory
+    assert len(os.listdir(cache_dir)) == 1
+    repo_env.close_env(env)